@@ -1,31 +1,184 @@
 #!/usr/bin/env python3
 """
-Simple end-to-end MCP over SSE test script (no third-party dependencies).
+Simple end-to-end MCP over SSE test script (standard library only; uses
+orjson, or pysimdjson for decoding, to speed up JSON when installed).
 
 Usage:
     scripts/test_mcp.py --base-url http://localhost:8765 --api-key <KEY>
 
 The script performs the handshake (initialize → initialized), lists tools
 and prompts, and prints the JSON responses.
+
+HTTP(S)_PROXY and NO_PROXY from the environment are honoured. HTTP redirects
+are not followed; point --base-url at the final server address.
 """
 
 from __future__ import annotations
 
-import argparse
-import json
 import os
+import re
 import sys
-import urllib.error
-import urllib.parse
-import urllib.request
-from typing import Any, Dict, Iterator, Optional
+from typing import TYPE_CHECKING, Any, Dict, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    import argparse
+    import http.client
+
+# argparse, http.client, urllib.parse and json are imported where they are
+# used so that --help and error paths do not pay for them at startup.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
 
 
-SESSION_EVENT_PREFIX = "data: "
+DATA_FIELD_PREFIX = b"data:"
+EVENT_FIELD_PREFIX = b"event:"
+SSE_EVENT_BOUNDARY = re.compile(rb"\r?\n\r?\n")
+SSE_READ_SIZE = 65536
+_BASE_HEADERS = {"Content-Type": "application/json", "Connection": "keep-alive"}
+_SSE_HEADERS = {"Accept": "text/event-stream"}
 DEFAULT_PROTOCOL_VERSION = "2024-11-05"
 
+if orjson is not None:
+    _loads = orjson.loads
+    _JSONDecodeError: type[Exception] = orjson.JSONDecodeError
+elif simdjson is not None:
+    _simdjson_parser = simdjson.Parser()
+
+    def _loads(payload: bytes | bytearray) -> Any:
+        return _simdjson_parser.parse(bytes(payload), recursive=True)
+
+    _JSONDecodeError = ValueError
+else:
+    import json
+
+    _loads = json.loads
+    _JSONDecodeError = json.JSONDecodeError
+
+
+def _dumps(content: Any, indent: bool = False) -> bytes:
+    """Serialize ``content`` to UTF-8 encoded JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_INDENT_2 if indent else None)
+    import json
+
+    return json.dumps(content, indent=2 if indent else None, ensure_ascii=False).encode("utf-8")
+
+
+# The handshake and listing requests are constants, so encode them once at import.
+_INITIALIZE_BODY = _dumps(
+    {
+        "jsonrpc": "2.0",
+        "id": 0,
+        "method": "initialize",
+        "params": {
+            "protocolVersion": DEFAULT_PROTOCOL_VERSION,
+            "capabilities": {},
+            "clientInfo": {"name": "mcp-test-script", "version": "0.1.0"},
+        },
+    }
+)
+_INITIALIZED_BODY = _dumps({"jsonrpc": "2.0", "method": "initialized", "params": {}})
+_TOOLS_BODY = _dumps({"jsonrpc": "2.0", "id": 1, "method": "tools/list"})
+_PROMPTS_BODY = _dumps({"jsonrpc": "2.0", "id": 2, "method": "prompts/list"})
+
+
+def _field_start(buf: bytearray, value_start: int, line_end: int) -> int:
+    """Return where an SSE field value starts once its optional leading space is skipped."""
+    if value_start < line_end and buf[value_start] == 0x20:
+        return value_start + 1
+    return value_start
+
+
+class _Connection(NamedTuple):
+    """
+    A keep-alive connection plus how requests on it must be addressed.
+
+    ``absolute_target`` is set when plain HTTP is forwarded through a proxy:
+    requests then carry the absolute URL and ``proxy_headers``.
+    """
+
+    conn: http.client.HTTPConnection
+    absolute_target: bool = False
+    proxy_headers: Optional[Dict[str, str]] = None
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class _SseFramer:
+    """
+    Split an SSE response into events.
+
+    The socket is read in large chunks into a rolling buffer. Event
+    boundaries and line ends are located with C-level searches, and each
+    event is parsed in place in that buffer.
+    """
+
+    def __init__(self, response: Any, conn: http.client.HTTPConnection) -> None:
+        self.response = response
+        self.conn = conn
+        self.buf = bytearray()
+        self._scanned = 0
+
+    def next_event(self) -> Optional[tuple[bytes, bytearray]]:
+        """
+        Return ``(event_type, data)`` for the next event carrying data, or
+        ``None`` once the stream has ended.
+        """
+        while True:
+            match = SSE_EVENT_BOUNDARY.search(self.buf, self._scanned)
+            if match is None:
+                # A boundary may straddle the chunk edge; rescan its first bytes.
+                self._scanned = max(len(self.buf) - 3, 0)
+                chunk = self.response.read1(SSE_READ_SIZE)
+                if not chunk:
+                    return None
+                self.buf += chunk
+                continue
+
+            buf = self.buf
+            end = match.start()
+            event_type = b"message"
+            # Data line values are copied out of the rolling buffer exactly
+            # once, each followed by its separating newline; the trailing one
+            # is dropped in place.
+            data = bytearray()
+            with memoryview(buf) as view:
+                pos = 0
+                while pos < end:
+                    eol = buf.find(b"\n", pos, end)
+                    if eol == -1:
+                        eol = end
+                    line_end = eol - 1 if eol > pos and buf[eol - 1] == 0x0D else eol
+                    if buf.startswith(DATA_FIELD_PREFIX, pos, line_end):
+                        data += view[_field_start(buf, pos + len(DATA_FIELD_PREFIX), line_end) : line_end]
+                        data += b"\n"
+                    elif buf.startswith(EVENT_FIELD_PREFIX, pos, line_end):
+                        event_type = bytes(view[_field_start(buf, pos + len(EVENT_FIELD_PREFIX), line_end) : line_end])
+                    pos = eol + 1
+            del buf[: match.end()]
+            self._scanned = 0
+
+            if data:
+                del data[-1:]
+                return event_type, data
+
+    def close(self) -> None:
+        self.response.close()
+        self.conn.close()
+
 
 def parse_args() -> argparse.Namespace:
+    import argparse
+
     parser = argparse.ArgumentParser(description="Test PlantUML MCP server over SSE transport.")
     parser.add_argument(
         "--base-url",
@@ -46,101 +199,176 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def read_session_endpoint(base_url: str, api_key: str, timeout: float) -> tuple[str, Any]:
-    headers: Dict[str, str] = {}
-    if api_key:
-        headers["Authorization"] = f"Bearer {api_key}"
+def auth_headers(api_key: Optional[str]) -> Dict[str, str]:
+    """
+    Build the Authorization header once per run, shared by the SSE GET and the POSTs.
+    """
+    if not api_key:
+        return {}
+    return {"Authorization": f"Bearer {api_key}"}
+
+
+def read_session_endpoint(stream_url: str, auth: Dict[str, str], timeout: float) -> tuple[str, _SseFramer]:
+    import urllib.parse
 
-    stream_url = urllib.parse.urljoin(base_url.rstrip("/") + "/", "sse")
+    headers = {**_SSE_HEADERS, **auth}
     session_url: Optional[str] = None
 
-    request = urllib.request.Request(stream_url, headers=headers, method="GET")
-    response = urllib.request.urlopen(request, timeout=timeout)
+    connection = open_connection(stream_url, timeout)
+    response = _send(connection, "GET", stream_url, headers)
+    if response.status >= 400:
+        details = response.read().decode("utf-8", errors="replace")
+        connection.close()
+        raise RuntimeError(f"HTTP {response.status} {response.reason}: {details}")
 
+    stream = _SseFramer(response, connection.conn)
     while True:
-        raw_line = response.readline()
-        if not raw_line:
+        event = stream.next_event()
+        if event is None:
             break
-        line = raw_line.decode("utf-8", errors="replace").strip()
-        if not line:
-            continue
-        if line.startswith(SESSION_EVENT_PREFIX):
-            session_url = line[len(SESSION_EVENT_PREFIX) :].strip()
+        event_type, data = event
+        if event_type == b"endpoint":
+            endpoint = data.decode("utf-8", errors="replace").strip()
+            # urljoin would turn an empty endpoint into the stream URL itself.
+            if endpoint:
+                session_url = urllib.parse.urljoin(stream_url, endpoint)
             break
 
     if not session_url:
-        response.close()
+        stream.close()
         raise RuntimeError("Did not receive session endpoint from SSE stream.")
 
-    return session_url, response
+    return session_url, stream
 
 
-def wait_for_json_message(response: Any, timeout: float) -> Dict[str, Any]:
+def wait_for_json_message(stream: _SseFramer, response_id: Optional[int] = None) -> Dict[str, Any]:
     """
     Read the next JSON message from the SSE stream.
-    """
-    try:
-        raw_sock = response.fp.raw  # type: ignore[attr-defined]
-        if hasattr(raw_sock, "settimeout"):
-            raw_sock.settimeout(timeout)
-    except Exception:
-        pass
-
-    event_type: Optional[str] = None
-    data_lines: list[str] = []
 
+    When ``response_id`` is given, messages that are not the JSON-RPC response
+    with that id (e.g. server log notifications) are skipped; a payload that is
+    not valid JSON is returned as ``{"raw": ...}`` either way. Reads block on
+    the stream's socket, which carries the timeout given to ``open_connection``.
+    """
     while True:
-        raw_line = response.readline()
-        if not raw_line:
+        event = stream.next_event()
+        if event is None:
             raise RuntimeError("SSE stream closed unexpectedly.")
 
-        line = raw_line.decode("utf-8", errors="replace").rstrip("\r\n")
-
-        if line.startswith("event:"):
-            event_type = line[len("event:") :].strip()
-        elif line.startswith("data:"):
-            data_lines.append(line[len("data:") :].strip())
-        elif line == "":
-            if data_lines:
-                payload = "\n".join(data_lines)
-                data_lines.clear()
-                if event_type != "message":
-                    event_type = None
-                    continue
-                if payload:
-                    try:
-                        return json.loads(payload)
-                    except json.JSONDecodeError:
-                        return {"raw": payload}
-            event_type = None
-
-
-def post_json(url: str, payload: Dict[str, Any], api_key: Optional[str], timeout: float) -> Dict[str, Any]:
-    data = json.dumps(payload).encode("utf-8")
-    headers = {"Content-Type": "application/json"}
-    if api_key:
-        headers["Authorization"] = f"Bearer {api_key}"
-
-    request = urllib.request.Request(url, headers=headers, data=data, method="POST")
+        event_type, payload = event
+        if event_type != b"message" or not payload or payload.isspace():
+            continue
+        try:
+            message = _loads(payload)
+        except _JSONDecodeError:
+            # Unparseable replies carry no id to match; surface them as-is.
+            return {"raw": payload.decode("utf-8", errors="replace")}
+        if response_id is None or (isinstance(message, dict) and message.get("id") == response_id):
+            return message
+
+
+def open_connection(url: str, timeout: float) -> _Connection:
+    """
+    Open a keep-alive connection to the origin of ``url``, going through the
+    environment's proxy for its scheme unless ``no_proxy`` excludes the host.
+    """
+    import base64
+    import http.client
+    import urllib.parse
+    import urllib.request
+
+    parts = urllib.parse.urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    proxy = urllib.request.getproxies().get(parts.scheme)
+    if not proxy or urllib.request.proxy_bypass(parts.netloc):
+        return _Connection(connection_class(parts.netloc, timeout=timeout))
+
+    if "://" not in proxy:
+        proxy = f"http://{proxy}"
+    proxy_parts = urllib.parse.urlsplit(proxy)
+    proxy_headers: Dict[str, str] = {}
+    if proxy_parts.username:
+        username = urllib.parse.unquote(proxy_parts.username)
+        password = urllib.parse.unquote(proxy_parts.password or "")
+        token = base64.b64encode(f"{username}:{password}".encode("utf-8")).decode("ascii")
+        proxy_headers["Proxy-Authorization"] = f"Basic {token}"
+
+    if proxy_parts.scheme == "https":
+        proxy_port = proxy_parts.port or http.client.HTTPS_PORT
+    else:
+        proxy_port = proxy_parts.port or http.client.HTTP_PORT
+
+    if parts.scheme == "https":
+        # TLS goes end-to-end through a CONNECT tunnel opened on first use.
+        conn = connection_class(proxy_parts.hostname, proxy_port, timeout=timeout)
+        conn.set_tunnel(parts.hostname, parts.port, headers=proxy_headers)
+        return _Connection(conn)
+
+    # Plain HTTP is forwarded: requests carry the absolute URL (see _send).
+    proxy_class = http.client.HTTPSConnection if proxy_parts.scheme == "https" else http.client.HTTPConnection
+    conn = proxy_class(proxy_parts.hostname, proxy_port, timeout=timeout)
+    return _Connection(conn, absolute_target=True, proxy_headers=proxy_headers)
+
+
+def _request_target(url: str) -> str:
+    import urllib.parse
+
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path = f"{path}?{parts.query}"
+    return path
+
+
+def _send(
+    connection: _Connection, method: str, url: str, headers: Dict[str, str], body: Optional[bytes] = None
+) -> http.client.HTTPResponse:
+    if connection.absolute_target:
+        target = url
+        headers = {**headers, **(connection.proxy_headers or {})}
+    else:
+        target = _request_target(url)
+    connection.conn.request(method, target, body=body, headers=headers)
+    return connection.conn.getresponse()
+
+
+def post_raw(connection: _Connection, url: str, data: bytes, headers: Dict[str, str]) -> Dict[str, Any]:
+    """
+    POST an already-encoded JSON body and return the decoded acknowledgement.
+    """
+    reused = connection.conn.sock is not None
     try:
-        with urllib.request.urlopen(request, timeout=timeout) as response:
-            body = response.read()
-            if body:
-                text = body.decode("utf-8").strip()
-                if text:
-                    try:
-                        return json.loads(text)
-                    except json.JSONDecodeError:
-                        return {"raw": text}
-            return {}
-    except urllib.error.HTTPError as error:
-        details = error.read().decode("utf-8", errors="replace")
-        raise RuntimeError(f"HTTP {error.code} {error.reason}: {details}") from error
+        response = _send(connection, "POST", url, headers, data)
+    except (BrokenPipeError, ConnectionResetError):
+        if not reused:
+            raise
+        # The server dropped the idle keep-alive connection (this includes
+        # http.client.RemoteDisconnected); reconnect once.
+        connection.close()
+        response = _send(connection, "POST", url, headers, data)
+    # Drain the body fully so the connection can carry the next request.
+    body = response.read()
+    if response.status >= 400:
+        details = body.decode("utf-8", errors="replace")
+        raise RuntimeError(f"HTTP {response.status} {response.reason}: {details}")
+    if body and not body.isspace():
+        try:
+            return _loads(body)
+        except _JSONDecodeError:
+            return {"raw": body.decode("utf-8", errors="replace").strip()}
+    return {}
 
 
 def pretty_print(title: str, content: Dict[str, Any]) -> None:
+    """
+    Print ``content`` indented on a terminal and as compact JSON when redirected.
+    """
     print(f"\n=== {title} ===")
-    print(json.dumps(content, indent=2, ensure_ascii=False))
+    body = _dumps(content, indent=sys.stdout.isatty())
+    # Write the encoded bytes directly, after flushing any pending text output.
+    sys.stdout.flush()
+    sys.stdout.buffer.write(body + b"\n")
+    sys.stdout.buffer.flush()
 
 
 def main() -> int:
@@ -150,56 +378,36 @@ def main() -> int:
         return 1
 
     base_url = args.base_url.rstrip("/")
+    stream_url = base_url + "/sse"
     print(f"Connecting to {base_url} …")
-    session_endpoint, sse_response = read_session_endpoint(base_url, args.api_key, args.timeout)
+    auth = auth_headers(args.api_key)
+    session_endpoint, sse_stream = read_session_endpoint(stream_url, auth, args.timeout)
     print(f"Session messages endpoint: {session_endpoint}")
+    connection = open_connection(session_endpoint, args.timeout)
+    headers = {**_BASE_HEADERS, **auth}
 
-    initialize_payload = {
-        "jsonrpc": "2.0",
-        "id": 0,
-        "method": "initialize",
-        "params": {
-            "protocolVersion": DEFAULT_PROTOCOL_VERSION,
-            "capabilities": {},
-            "clientInfo": {"name": "mcp-test-script", "version": "0.1.0"},
-        },
-    }
-    init_response = post_json(session_endpoint, initialize_payload, args.api_key, args.timeout)
+    init_response = post_raw(connection, session_endpoint, _INITIALIZE_BODY, headers)
     pretty_print("Initialize response (HTTP acknowledgement)", init_response)
-    init_result = wait_for_json_message(sse_response, args.timeout)
+    init_result = wait_for_json_message(sse_stream, response_id=0)
     pretty_print("Initialize result (SSE)", init_result)
 
-    initialized_payload = {
-        "jsonrpc": "2.0",
-        "method": "initialized",
-        "params": {},
-    }
-    post_json(session_endpoint, initialized_payload, args.api_key, args.timeout)
+    post_raw(connection, session_endpoint, _INITIALIZED_BODY, headers)
     print("Sent initialized notification.")
 
-    tools_payload = {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "method": "tools/list",
-    }
-    tools_ack = post_json(session_endpoint, tools_payload, args.api_key, args.timeout)
+    tools_ack = post_raw(connection, session_endpoint, _TOOLS_BODY, headers)
     pretty_print("Tools list (HTTP acknowledgement)", tools_ack)
-    tools_response = wait_for_json_message(sse_response, args.timeout)
+    tools_response = wait_for_json_message(sse_stream, response_id=1)
     pretty_print("Tools list (SSE)", tools_response)
 
-    prompts_payload = {
-        "jsonrpc": "2.0",
-        "id": 2,
-        "method": "prompts/list",
-    }
-    prompts_ack = post_json(session_endpoint, prompts_payload, args.api_key, args.timeout)
+    prompts_ack = post_raw(connection, session_endpoint, _PROMPTS_BODY, headers)
     pretty_print("Prompts list (HTTP acknowledgement)", prompts_ack)
-    prompts_response = wait_for_json_message(sse_response, args.timeout)
+    prompts_response = wait_for_json_message(sse_stream, response_id=2)
     pretty_print("Prompts list (SSE)", prompts_response)
 
     print("\nMCP handshake and queries completed successfully.")
+    connection.close()
     try:
-        sse_response.close()
+        sse_stream.close()
     except Exception:
         pass
     return 0